@@ -1,11 +1,11 @@
 # v2v_simulation.py
 import streamlit as st
 import pandas as pd
-import random, uuid, math, hashlib
-from dataclasses import dataclass, field
-from typing import List, Dict
+import uuid, hashlib, struct, threading
+from functools import partial
 import altair as alt
 import numpy as np
+from numba import njit, prange, typed, config as numba_config
 
 # ==========================================
 # 1. SETUP PAGE AND INTRODUCTION
@@ -31,250 +31,446 @@ high_speed_network = st.sidebar.checkbox("Enable High-Speed 5G Network", True, h
 simulation_seed = st.sidebar.number_input("Random Seed (for reproducibility)", 0, 99999, 1234)
 run_button = st.sidebar.button("🚀 Run Simulation", type="primary")
 
+st.sidebar.header("🎲 Monte Carlo")
+number_of_seeds = st.sidebar.slider("Number of Random Seeds", 10, 500, 100, help="How many simulations to run in parallel, using seeds counting up from the Random Seed. The first seed replays the single simulation.")
+monte_carlo_button = st.sidebar.button("🎲 Run Monte Carlo")
+
 inductive_range_meters = 3  # Cars must be within 3 meters to charge
+road_length_meters = 800.0  # Cars drive around a circular road
+time_step = 0.01  # small time increment
 
 # ==========================================
 # 3. DEFINE THE "VEHICLE" BLOCKS
 # ==========================================
-@dataclass
-class ElectricVehicle:
-    id: str = field(default_factory=lambda: str(uuid.uuid4())[:8])
-    current_battery_kwh: float = 50.0
-    total_capacity_kwh: float = 75.0
-    role: str = "neutral"  # Can be 'buyer', 'seller', or 'neutral'
-    asking_price: float = 0.20
-    max_charge_speed: float = 5.0
-    position_on_road: float = 0.0
-    current_speed_kmh: float = 40.0
-    
-    # Internal brain for learning price history (Reinforcement Learning light)
-    price_memory: Dict[float,float] = field(default_factory=dict)
-    possible_prices: List[float] = field(default_factory=lambda:[0.08,0.12,0.16,0.20,0.25,0.30])
-    exploration_rate: float = 0.15
-    
-    def decide_buying_or_selling(self):
-        # Step 1: Check Battery Level (State of Charge)
-        battery_percentage = self.current_battery_kwh / self.total_capacity_kwh
-        
-        # Step 2: Decide Role
-        if battery_percentage < 0.40:
-            self.role = 'buyer'  # "I need power!"
-        elif battery_percentage > 0.60:
-            self.role = 'seller' # "I have extra power to sell."
-        else:
-            self.role = 'neutral' # "I'm good for now."
-
-    def set_price_strategy(self):
-        # Initialize memory if empty
-        for p in self.possible_prices:
-            if p not in self.price_memory:
-                self.price_memory[p] = 0.0
-        
-        # Randomly try a new price sometimes (Exploration)
-        if random.random() < self.exploration_rate:
-            self.asking_price = random.choice(self.possible_prices)
-        else:
-            # Otherwise, pick the best known price (Exploitation)
-            best_value = max(self.price_memory.values())
-            candidates = [p for p,v in self.price_memory.items() if v == best_value]
-            self.asking_price = random.choice(candidates)
+# The fleet is stored as a Structure-of-Arrays: one NumPy array per vehicle
+# property, indexed by car number. Every per-round step is a whole-array op.
+# Roles are small integer codes; ROLE_NAMES maps them back to text for export.
+NEUTRAL = 0  # "I'm good for now."
+BUYER = 1    # "I need power!"
+SELLER = 2   # "I have extra power to sell."
+ROLE_NAMES = np.array(['neutral', 'buyer', 'seller'])
+
+CAPACITY_OPTIONS = np.array([60.0, 75.0, 90.0])
+STARTING_PRICES = np.array([0.10, 0.12, 0.14, 0.16, 0.18, 0.20, 0.22, 0.24, 0.26])
+MAX_CHARGE_OPTIONS = np.array([3.0, 5.0, 7.0])
+
+POSSIBLE_PRICES = np.array([0.08, 0.12, 0.16, 0.20, 0.25, 0.30])
+EXPLORATION_RATE = 0.15
+
+@njit(cache=True)
+def create_fleet(rng, n_cars):
+    # Initialize our fleet of cars (one array per property, drawn in one call each)
+    capacity = CAPACITY_OPTIONS[rng.integers(0, len(CAPACITY_OPTIONS), n_cars)]
+    battery = rng.uniform(0.12, 0.96, n_cars) * capacity  # 12% to 96% charged
+    price = STARTING_PRICES[rng.integers(0, len(STARTING_PRICES), n_cars)]
+    max_charge = MAX_CHARGE_OPTIONS[rng.integers(0, len(MAX_CHARGE_OPTIONS), n_cars)]
+    position = rng.uniform(0.0, road_length_meters, n_cars)
+    speed = rng.uniform(20.0, 80.0, n_cars)
+    return battery, capacity, price, max_charge, position, speed
+
+@njit(cache=True)
+def decide_buying_or_selling(battery_kwh, capacity_kwh):
+    # Step 1: Check Battery Level (State of Charge)
+    battery_percentage = battery_kwh / capacity_kwh
+
+    # Step 2: Decide Role
+    role = np.full(len(battery_percentage), NEUTRAL, np.int8)
+    role[battery_percentage < 0.40] = BUYER
+    role[battery_percentage > 0.60] = SELLER
+    return role
+
+@njit(cache=True)
+def set_price_strategy(price_values, rng):
+    # Internal brain for learning price history (Reinforcement Learning light):
+    # price_values[car, i] is what the car has learned about asking POSSIBLE_PRICES[i]
+    n_cars = len(price_values)
+
+    # Randomly try a new price sometimes (Exploration)
+    explore = rng.random(n_cars) < EXPLORATION_RATE
+    random_price = POSSIBLE_PRICES[rng.integers(0, len(POSSIBLE_PRICES), n_cars)]
+
+    # Otherwise, pick the best known price (Exploitation), breaking ties at random
+    tie_break = rng.random(price_values.shape)
+    best_price = np.empty(n_cars)
+    for car in range(n_cars):
+        is_best = price_values[car] == price_values[car].max()
+        best_price[car] = POSSIBLE_PRICES[np.argmax(is_best * tie_break[car])]
+
+    return np.where(explore, random_price, best_price)
 
 # ==========================================
 # 4. HELPER FUNCTIONS (The "Physics" of the world)
 # ==========================================
+@njit(cache=True)
 def calculate_alignment_score(distance_gap, side_offset, relative_speed_diff, max_range=3):
     """
     Calculates how well two cars are aligned for charging.
     Returns a score from 0.0 (No connection) to 1.0 (Perfect connection).
     """
-    score = 0.95
-    
     # Penalty if too far apart
-    if distance_gap < 0.1 or distance_gap > max_range:
-        score *= 0.2
-    else:
-        # Optimal charging is in the middle of the range
-        score *= math.exp(-((distance_gap - max_range/2)**2)/(2*(0.8**2)))
-        
-    # Penalty if not in the same lane (lateral offset)
-    score *= math.exp(-(side_offset**2)/(2*(0.15**2)))
+    out_of_range = distance_gap < 0.1 or distance_gap > max_range
     
-    # Penalty if speeds are too different
-    score *= math.exp(-abs(relative_speed_diff)/50.0)
+    # All penalties share one exponent, so a single exp() covers:
+    # - optimal charging in the middle of the range (only when in range)
+    # - not being in the same lane (lateral offset)
+    # - speeds being too different
+    exponent = ((0.0 if out_of_range else -((distance_gap - max_range/2)**2)/(2*(0.8**2)))
+                - (side_offset**2)/(2*(0.15**2))
+                - abs(relative_speed_diff)/50.0)
+    score = (0.95 * 0.2 if out_of_range else 0.95) * np.exp(exponent)
     
     return max(0.0, min(1.0, score))
 
-def get_network_latency(is_fast_network): 
+# Fixed binary layout of a transaction for hashing: 6 floats, the round, buyer id, seller id
+HASHED_FIELDS = ['energy_kwh', 'price_per_kwh', 'total_cost', 'latency_ms', 'distance_gap_m', 'alignment_quality', 'round']
+TX_RECORD = struct.Struct('<6di8s8s')
+
+def hash_transactions(ledger, buyer_ids, seller_ids):
+    """
+    Returns a short SHA-256 id for each transaction in the ledger columns.
+    Every transaction is packed into the fixed TX_RECORD layout, so ids don't
+    depend on how Python formats numbers or orders dict keys.
+    """
+    columns = [ledger[f].tolist() for f in HASHED_FIELDS]
+    return [
+        hashlib.sha256(TX_RECORD.pack(*fields, b.encode(), s.encode())).digest()[:6].hex()
+        for *fields, b, s in zip(*columns, buyer_ids, seller_ids)
+    ]
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def dataframe_to_csv(df):
+    # Only runs when a download button is clicked; cached per DataFrame contents
+    return df.to_csv(index=False).encode()
+
+@njit
+def get_network_latency(base_latency, jitter):
     # Simulate network delay (milliseconds)
-    base_latency = 30 if is_fast_network else 80
-    jitter = random.gauss(0,15)
-    return max(5, base_latency + jitter)
+    return max(5.0, base_latency + jitter)
+
+@njit(cache=True)
+def _match_round(base_latency, buyer_idx, seller_idx, window_lo, window_hi, price, pos, speed, batt, cap, max_chg,
+                 inductive_range, lateral_offsets, latency_jitter, out_energy, out_pair_i, out_pair_j, out_align,
+                 out_dist, out_latency):
+    """
+    Executes every deal of one round.
+    Buyers come highest bidder first; sellers are sorted by road position and
+    seller_idx[window_lo[b]:window_hi[b]] are the sellers within range of buyer b.
+    Batteries are updated in place; deals are written to the out_* arrays.
+    Returns the number of deals made.
+    """
+    # Step 1: Pick the pairs (physics check + price negotiation)
+    n_pairs = 0
+    seller_taken = np.zeros(len(seller_idx), np.bool_)
+    for b_idx in range(len(buyer_idx)):
+        buyer = buyer_idx[b_idx]
+        
+        # Among the free sellers close enough to charge, take the lowest asking price
+        best = -1
+        for s_idx in range(window_lo[b_idx], window_hi[b_idx]):
+            seller = seller_idx[s_idx]
+            if seller_taken[s_idx] or price[buyer] < price[seller]:
+                # No deal! Already charging someone, or price gap too wide.
+                continue
+            if best < 0 or price[seller] < price[seller_idx[best]]:
+                best = s_idx
+        if best < 0:
+            continue
+        
+        seller_taken[best] = True
+        out_pair_i[n_pairs] = buyer
+        out_pair_j[n_pairs] = seller_idx[best]
+        n_pairs += 1
+    
+    # Step 2: Execute Transactions
+    for k in range(n_pairs):
+        buyer, seller = out_pair_i[k], out_pair_j[k]
+        
+        # Detailed Physics simulation (in float64 locals; the out_* arrays may be float32 records)
+        distance = abs(pos[buyer] - pos[seller])
+        alignment = calculate_alignment_score(distance, lateral_offsets[k], speed[buyer] - speed[seller])
+        
+        # Calculate energy transfer efficiency
+        # Efficiency drops if alignment is poor or cars are far apart
+        efficiency = max(0.0, alignment * (1 - distance/inductive_range))
+        
+        # Determine how much energy is actually moved
+        energy_moved = max(0.1, efficiency * min(
+            max_chg[buyer],
+            max_chg[seller],
+            max(0.0, 0.4 * cap[buyer] - batt[buyer]), # Don't overcharge
+            max(0.0, batt[seller] - 0.6 * cap[seller])  # Don't drain seller
+        ))
+        
+        # Update Batteries
+        batt[buyer] += energy_moved
+        batt[seller] -= energy_moved
+        out_dist[k] = distance
+        out_align[k] = alignment
+        out_energy[k] = energy_moved
+        out_latency[k] = get_network_latency(base_latency, latency_jitter[k])
+    
+    return n_pairs
 
 # ==========================================
 # 5. MAIN SIMULATION ENGINE
 # ==========================================
+# Recorded numbers easily fit in 32 bits, which halves the memory of every table
+RECORD_DTYPES = {
+    'energy_kwh': np.float32,
+    'price_per_kwh': np.float32,
+    'total_cost': np.float32,
+    'round': np.int32,
+    'latency_ms': np.float32,
+    'distance_gap_m': np.float32,
+    'alignment_quality': np.float32,
+}
+
+@njit(cache=True)
+def _play_round(rng, use_fast_net, battery, capacity, max_charge, price, price_values, position, speed,
+                out_energy, out_pair_i, out_pair_j, out_align, out_dist, out_latency):
+    """
+    Plays one round for the whole fleet: shared by start_simulation and _one_sim,
+    so a seed gives the same run in both.
+    Batteries, prices and positions are updated in place; deals are written to the out_* arrays.
+    Returns (role, buyers, sellers, number of deals).
+    """
+    # 1. Every car makes a decision
+    role = decide_buying_or_selling(battery, capacity)
+    price[:] = set_price_strategy(price_values, rng)
+    
+    # 2. Group them (stable sorts)
+    buyers = np.flatnonzero(role == BUYER)
+    sellers = np.flatnonzero(role == SELLER)
+    buyers = buyers[np.argsort(-price[buyers], kind='mergesort')]      # Highest bidder first
+    sellers = sellers[np.argsort(position[sellers], kind='mergesort')] # Sorted along the road
+    
+    # Sellers within charging range of each buyer form one slice of the position-sorted sellers
+    seller_positions = position[sellers]
+    window_lo = np.searchsorted(seller_positions, position[buyers] - inductive_range_meters, side='left')
+    window_hi = np.searchsorted(seller_positions, position[buyers] + inductive_range_meters, side='right')
+    
+    # 3. Matchmaking logic (see _match_round)
+    n_slots = min(len(buyers), len(sellers))
+    lateral_offsets = rng.normal(0.0, 0.1, n_slots)
+    latency_jitter = rng.normal(0.0, 15.0, n_slots)
+    base_latency = 30.0 if use_fast_net else 80.0  # ms
+    n_pairs = _match_round(base_latency, buyers, sellers, window_lo, window_hi, price, position, speed, battery,
+                           capacity, max_charge, inductive_range_meters, lateral_offsets, latency_jitter,
+                           out_energy, out_pair_i, out_pair_j, out_align, out_dist, out_latency)
+    
+    # 4. Move all cars forward (Traffic Simulation)
+    # Position = Position + Speed * Time
+    position[:] = (position + speed * (1000/3600) * time_step) % road_length_meters
+    
+    return role, buyers, sellers, n_pairs
+
+# The outputs only depend on the arguments, so repeated settings are served from the cache
+@st.cache_data(show_spinner=False, max_entries=16, ttl=24*60*60)
 def start_simulation(n_cars, n_rounds, use_fast_net, sim_seed):
-    random.seed(sim_seed)
-    np.random.seed(sim_seed)
+    rng = np.random.default_rng(sim_seed)
     
-    road_length_meters = 800.0
-    fleet = []
+    # Initialize our fleet of cars (one array per property)
+    battery, capacity, price, max_charge, position, speed = create_fleet(rng, n_cars)
+    role = np.full(n_cars, NEUTRAL, np.int8)
+    price_values = np.zeros((n_cars, len(POSSIBLE_PRICES)))
     
-    # Initialize our fleet of cars
-    for _ in range(n_cars):
-        capacity = random.choice([60.0, 75.0, 90.0])
-        initial_charge = random.uniform(0.12, 0.96) # 12% to 96% charged
-        
-        new_car = ElectricVehicle(
-            current_battery_kwh = initial_charge * capacity,
-            total_capacity_kwh = capacity,
-            asking_price = random.choice([0.10,0.12,0.14,0.16,0.18,0.20,0.22,0.24,0.26]),
-            max_charge_speed = random.choice([3.0,5.0,7.0]),
-            position_on_road = random.uniform(0, road_length_meters),
-            current_speed_kmh = random.uniform(20, 80)
-        )
-        fleet.append(new_car)
+    # Preallocated ledger columns: at most n_cars // 2 deals happen per round
+    tx_capacity = n_rounds * (n_cars // 2)
+    ledger = {
+        'buyer': np.empty(tx_capacity, np.int32),
+        'seller': np.empty(tx_capacity, np.int32),
+        **{col: np.empty(tx_capacity, dtype) for col, dtype in RECORD_DTYPES.items()},
+    }
+    n_tx = 0
     
-    transaction_ledger = []
-    detailed_logs = []
+    # Preallocated columns for cars that found no match (buyers and sellers)
+    unmatched = {
+        'car': np.empty(n_rounds * n_cars, np.int32),
+        'round': np.empty(n_rounds * n_cars, RECORD_DTYPES['round']),
+        'is_buyer': np.empty(n_rounds * n_cars, np.bool_),
+    }
+    n_unmatched = 0
     
     # --- START THE LOOP (Round by Round) ---
     for r in range(n_rounds):
         
-        # 1. Every car makes a decision
-        for car in fleet:
-            car.decide_buying_or_selling()
-            car.set_price_strategy()
-        
-        # 2. Group them
-        active_buyers = [c for c in fleet if c.role == 'buyer']
-        active_sellers = [c for c in fleet if c.role == 'seller']
-        
-        # Sort to prioritize best offers
-        active_buyers.sort(key=lambda x: x.asking_price, reverse=True) # Highest bidder first
-        active_sellers.sort(key=lambda x: x.asking_price)              # Lowest seller first
+        # 1. Every car decides, trades and moves on (compiled, see _play_round); deals go straight into the ledger
+        role, active_buyers, active_sellers, n_pairs = _play_round(
+            rng, use_fast_net, battery, capacity, max_charge, price, price_values, position, speed,
+            ledger['energy_kwh'][n_tx:], ledger['buyer'][n_tx:], ledger['seller'][n_tx:],
+            ledger['alignment_quality'][n_tx:], ledger['distance_gap_m'][n_tx:], ledger['latency_ms'][n_tx:])
         
-        # 3. Matchmaking logic
-        b_idx, s_idx = 0, 0
-        while b_idx < len(active_buyers) and s_idx < len(active_sellers):
-            buyer = active_buyers[b_idx]
-            seller = active_sellers[s_idx]
+        # Record the deals
+        deals = slice(n_tx, n_tx + n_pairs)
+        ledger['price_per_kwh'][deals] = (price[ledger['buyer'][deals]] + price[ledger['seller'][deals]]) / 2.0
+        ledger['total_cost'][deals] = ledger['price_per_kwh'][deals] * ledger['energy_kwh'][deals]
+        ledger['round'][deals] = r
+        n_tx += n_pairs
             
-            # Price Negotiation
-            if buyer.asking_price < seller.asking_price: 
-                # No deal! Price gap too wide.
-                b_idx += 1
-                continue
-            
-            # Physics Check: Are they close enough?
-            distance_gap = abs(buyer.position_on_road - seller.position_on_road)
-            if distance_gap > inductive_range_meters:
-                b_idx += 1; s_idx += 1
-                continue
-            
-            # Detailed Physics simulation
-            lateral_offset = random.gauss(0, 0.1)
-            speed_diff = abs(buyer.current_speed_kmh - seller.current_speed_kmh)
-            alignment_quality = calculate_alignment_score(distance_gap, lateral_offset, speed_diff)
-            
-            # Execute Transaction
-            network_delay = get_network_latency(use_fast_net)
-            final_price = (buyer.asking_price + seller.asking_price) / 2.0
-            
-            # Calculate energy transfer efficiency
-            # Efficiency drops if alignment is poor or cars are far apart
-            efficiency = max(0, alignment_quality * (1 - distance_gap/inductive_range_meters))
-            
-            # Determine how much energy is actually moved
-            energy_moved = max(0.1, efficiency * min(
-                buyer.max_charge_speed, 
-                seller.max_charge_speed, 
-                max(0, 0.4 * buyer.total_capacity_kwh - buyer.current_battery_kwh), # Don't overcharge
-                max(0, seller.current_battery_kwh - 0.6 * seller.total_capacity_kwh)  # Don't drain seller
-            ))
-            
-            transfer_successful = energy_moved > 0
-            
-            if transfer_successful:
-                # Update Batteries
-                buyer.current_battery_kwh += energy_moved
-                seller.current_battery_kwh -= energy_moved
-                
-                # Record the deal
-                total_cost = final_price * energy_moved
-                
-                record = {
-                    'buyer_id': buyer.id,
-                    'seller_id': seller.id,
-                    'energy_kwh': energy_moved,
-                    'price_per_kwh': final_price,
-                    'total_cost': total_cost,
-                    'round': r,
-                    'latency_ms': network_delay,
-                    'distance_gap_m': distance_gap,
-                    'alignment_quality': alignment_quality
-                }
-                
-                # Generate a unique secure hash for the transaction (Blockchain style)
-                tx_hash = hashlib.sha256(str(record).encode()).hexdigest()[:12]
-                record['tx_hash'] = tx_hash
-                
-                transaction_ledger.append(record)
-                detailed_logs.append({**record, 'success': True})
-            else:
-                detailed_logs.append({
-                    'buyer_id': buyer.id,
-                    'seller_id': seller.id,
-                    'energy_kwh': energy_moved,
-                    'price_per_kwh': final_price,
-                    'round': r,
-                    'success': False,
-                    'distance_gap_m': distance_gap,
-                    'latency_ms': network_delay
-                })
-            
-            # Move to next pair
-            b_idx += 1; s_idx += 1
-            
-        # 4. Log cars that found no match
-        matched_buyers = {tx['buyer_id'] for tx in transaction_ledger}
-        matched_sellers = {tx['seller_id'] for tx in transaction_ledger}
-
-        for b in active_buyers:
-            if b.id not in matched_buyers:
-                detailed_logs.append({'buyer_id': b.id, 'energy_kwh': 0, 'round': r, 'success': False, 'reason': 'no_seller_found'})
-
-        for s in active_sellers:
-            if s.id not in matched_sellers:
-                detailed_logs.append({'seller_id': s.id, 'energy_kwh': 0, 'round': r, 'success': False, 'reason': 'no_buyer_found'})
-
-        # 5. Move all cars forward (Traffic Simulation)
-        for car in fleet:
-            time_step = 0.01 # small time increment
-            # Position = Position + Speed * Time
-            car.position_on_road = (car.position_on_road + car.current_speed_kmh * 1000/3600 * time_step) % road_length_meters
+        # 2. Log cars that found no match this round
+        matched = np.zeros(n_cars, np.bool_)
+        matched[ledger['buyer'][deals]] = True
+        matched[ledger['seller'][deals]] = True
+        for cars, is_buyer in ((active_buyers, True), (active_sellers, False)):
+            lonely = cars[~matched[cars]]
+            unmatched['car'][n_unmatched:n_unmatched + len(lonely)] = lonely
+            unmatched['round'][n_unmatched:n_unmatched + len(lonely)] = r
+            unmatched['is_buyer'][n_unmatched:n_unmatched + len(lonely)] = is_buyer
+            n_unmatched += len(lonely)
+    
+    # Final cleanup of data for charts (one DataFrame build per table, no per-row dicts)
+    car_ids = np.array([str(uuid.UUID(bytes=rng.bytes(16), version=4))[:8] for _ in range(n_cars)])  # only used for logging
+    ledger = {col: values[:n_tx] for col, values in ledger.items()}
+    unmatched = {col: values[:n_unmatched] for col, values in unmatched.items()}
+    buyer_ids, seller_ids = car_ids[ledger.pop('buyer')], car_ids[ledger.pop('seller')]
     
-    # Final cleanup of data for charts
-    df_logs = pd.DataFrame(detailed_logs)
-    df_fleet = pd.DataFrame([{
-        'id': c.id,
-        'battery_percentage': c.current_battery_kwh / c.total_capacity_kwh,
-        'current_battery_kwh': c.current_battery_kwh,
-        'total_capacity_kwh': c.total_capacity_kwh,
-        'asking_price': c.asking_price,
-        'position_m': c.position_on_road,
-        'speed_kmh': c.current_speed_kmh
-    } for c in fleet])
+    df_ledger = pd.DataFrame({'buyer_id': buyer_ids, 'seller_id': seller_ids, **ledger})
+    # Generate a unique secure hash for every transaction (Blockchain style)
+    df_ledger['tx_hash'] = hash_transactions(ledger, buyer_ids, seller_ids)
+    
+    unmatched_ids = pd.Series(car_ids[unmatched['car']])
+    df_unmatched = pd.DataFrame({
+        'buyer_id': unmatched_ids.where(unmatched['is_buyer']),
+        'seller_id': unmatched_ids.mask(unmatched['is_buyer']),
+        'energy_kwh': RECORD_DTYPES['energy_kwh'](0),
+        'round': unmatched['round'],
+        'success': False,
+        'reason': np.where(unmatched['is_buyer'], 'no_seller_found', 'no_buyer_found'),
+    })
+    # Per round: the deals first, then the cars left without a partner
+    df_logs = (pd.concat([df_ledger.assign(success=True), df_unmatched], ignore_index=True)
+               .astype(RECORD_DTYPES, copy=False)
+               .sort_values('round', kind='stable', ignore_index=True))
+    
+    df_fleet = pd.DataFrame({
+        'id': car_ids,
+        'battery_percentage': battery / capacity,
+        'current_battery_kwh': battery,
+        'total_capacity_kwh': capacity,
+        'asking_price': price,
+        'position_m': position,
+        'speed_kmh': speed,
+        'role': ROLE_NAMES[role],  # role in the last round
+        'visual_jitter': rng.uniform(0, 10, n_cars)  # vertical spread for the map chart only
+    })
     
-    df_ledger = pd.DataFrame(transaction_ledger)
     return df_logs, df_fleet, df_ledger
 
+@njit(cache=True)
+def _one_sim(rng, n_cars, n_rounds, use_fast_net):
+    """
+    start_simulation without the record keeping, for Monte Carlo sweeps:
+    plays the same rounds from the same draws and returns the energy shared per round.
+    """
+    battery, capacity, price, max_charge, position, speed = create_fleet(rng, n_cars)
+    price_values = np.zeros((n_cars, len(POSSIBLE_PRICES)))
+    
+    # Deal columns, reused every round
+    n_slots = n_cars // 2
+    out_energy = np.empty(n_slots)
+    out_pair_i = np.empty(n_slots, np.int32)
+    out_pair_j = np.empty(n_slots, np.int32)
+    out_align = np.empty(n_slots)
+    out_dist = np.empty(n_slots)
+    out_latency = np.empty(n_slots)
+    
+    energy_per_round = np.zeros(n_rounds)
+    for r in range(n_rounds):
+        n_pairs = _play_round(rng, use_fast_net, battery, capacity, max_charge, price, price_values, position, speed,
+                              out_energy, out_pair_i, out_pair_j, out_align, out_dist, out_latency)[3]
+        energy_per_round[r] = out_energy[:n_pairs].sum()
+    
+    return energy_per_round
+
+# Streamlit runs the page in a worker thread, where Numba's TBB backend can keep
+# the server from shutting down, so prefer the OpenMP or workqueue backends
+numba_config.THREADING_LAYER_PRIORITY = ["omp", "workqueue", "tbb"]
+
+@st.cache_resource
+def monte_carlo_lock():
+    # One sweep at a time per server: each already uses every core, and the
+    # workqueue backend can't run parallel sections from two sessions at once
+    return threading.Lock()
+
+@njit(parallel=True, cache=True)
+def _run_many_seeds(rngs, n_cars, n_rounds, use_fast_net):
+    results = np.empty((len(rngs), n_rounds))
+    for i in prange(len(rngs)):
+        results[i] = _one_sim(rngs[np.int64(i)], n_cars, n_rounds, use_fast_net)  # typed lists want a signed index
+    return results
+
+@st.cache_data(show_spinner=False, max_entries=16, ttl=24*60*60)
+def run_many_seeds(seeds, n_cars, n_rounds, use_fast_net):
+    """
+    Runs one simulation per seed, spread over all CPU cores.
+    Returns the energy shared per round as an array of shape (len(seeds), n_rounds).
+    """
+    with monte_carlo_lock():
+        # One generator per seed, seeded exactly like start_simulation's
+        rngs = typed.List([np.random.default_rng(seed) for seed in seeds])
+        return _run_many_seeds(rngs, n_cars, n_rounds, use_fast_net)
+
 # ==========================================
-# 6. RUN BUTTON PRESSED? EXECUTE!
+# 6. CHART LAYOUTS
 # ==========================================
-if run_button:
-    with st.spinner("Simulating the Future of Highways..."):
-        df_logs, df_fleet, df_ledger = start_simulation(number_of_cars, simulation_duration, high_speed_network, simulation_seed)
+# The Vega-Lite specs only depend on column names, so they are built once per
+# server process and the data is attached when the chart is drawn.
+def chart_layout(chart):
+    spec = chart.to_dict()
+    spec.pop('data', None)
+    spec.pop('datasets', None)
+    return spec
+
+@st.cache_resource
+def energy_chart_spec():
+    return chart_layout(alt.Chart().mark_line(point=True, color='#FF6B6B').encode(
+        x=alt.X('round:Q', title='Simulation Time (Rounds)'),
+        y=alt.Y('energy_kwh:Q', title='Energy Shared (kWh)'),
+        tooltip=['round:Q','energy_kwh:Q']
+    ).properties(height=300, width=600, title="⚡ Energy Exchanged Over Time"))
+
+@st.cache_resource
+def latency_chart_spec():
+    return chart_layout(alt.Chart().mark_bar(color='#4ECDC4').encode(
+        alt.X('latency_ms:Q', bin=alt.Bin(maxbins=30), title='Network Delay (milliseconds)'),
+        y=alt.Y('count()', title='Number of Transactions')
+    ).properties(height=200, width=450, title="📶 5G Network Speed Distribution").configure_title(offset=20))
+
+@st.cache_resource
+def map_chart_spec():
+    return chart_layout(alt.Chart().mark_circle(size=100).encode(
+        x=alt.X('position_m:Q', title='Car Position on Road (meters)'),
+        y=alt.Y('visual_jitter:Q', title='', axis=None),
+        color=alt.Color('battery_percentage:Q', scale=alt.Scale(scheme='redyellowgreen'), title='Battery %'),
+        tooltip=[alt.Tooltip('id:N', title='Car ID'), alt.Tooltip('battery_percentage:Q', format='.1%', title='Battery Level')]
+    ).properties(height=180, width=800, title="🚗 Live Vehicle Map (Color = Battery Level)"))
+
+@st.cache_resource
+def monte_carlo_chart_spec():
+    base = alt.Chart().encode(x=alt.X('round:Q', title='Simulation Time (Rounds)'))
+    band = base.mark_area(opacity=0.3, color='#FF6B6B').encode(
+        y=alt.Y('low_kwh:Q', title='Total Energy Shared So Far (kWh)'),
+        y2='high_kwh:Q'
+    )
+    line = base.mark_line(color='#FF6B6B').encode(
+        y='mean_kwh:Q',
+        tooltip=['round:Q', alt.Tooltip('mean_kwh:Q', format='.2f'), alt.Tooltip('low_kwh:Q', format='.2f'), alt.Tooltip('high_kwh:Q', format='.2f')]
+    )
+    return chart_layout(alt.layer(band, line).properties(height=300, width=600, title="🎲 Energy Shared Across Seeds (mean, 5%-95% band)"))
+
+# ==========================================
+# 7. RUN BUTTON PRESSED? EXECUTE!
+# ==========================================
+# Results of the last run are kept in the session, keyed by the settings that
+# produced them, so reruns (e.g. a download click) don't simulate again
+simulation_settings = (number_of_cars, simulation_duration, high_speed_network, simulation_seed)
+if run_button and st.session_state.get('last_settings') != simulation_settings:
+    with st.spinner("Simulating the Future of Highways... (the very first run compiles the simulation, about 15 seconds)"):
+        st.session_state['results'] = start_simulation(*simulation_settings)
+    st.session_state['last_settings'] = simulation_settings
+
+if st.session_state.get('last_settings') == simulation_settings:
+    df_logs, df_fleet, df_ledger = st.session_state['results']
     
     st.success("Simulation Complete! Analyzing Data...")
     
@@ -306,31 +502,15 @@ if run_button:
     st.header("📈 Visual Analysis")
 
     # Chart 1: Energy over time
-    chart_energy = alt.Chart(df_energy_timeline).mark_line(point=True, color='#FF6B6B').encode(
-        x=alt.X('round:Q', title='Simulation Time (Rounds)'),
-        y=alt.Y('energy_kwh:Q', title='Energy Shared (kWh)'),
-        tooltip=['round','energy_kwh']
-    ).properties(height=300, width=600, title="⚡ Energy Exchanged Over Time")
-    st.altair_chart(chart_energy, use_container_width=True)
+    st.vega_lite_chart(df_energy_timeline, energy_chart_spec(), use_container_width=True)
     
     # Chart 2: Network Latency
     if 'latency_ms' in df_logs.columns and not df_logs['latency_ms'].dropna().empty:
         st.markdown("###### 📶 5G Network Speed Distribution")
-        chart_latency = alt.Chart(df_logs).mark_bar(color='#4ECDC4').encode(
-            alt.X('latency_ms:Q', bin=alt.Bin(maxbins=30), title='Network Delay (milliseconds)'),
-            y=alt.Y('count()', title='Number of Transactions')
-        ).properties(height=200, width=450, title="📶 5G Network Speed Distribution").configure_title(offset=20)
-        st.altair_chart(chart_latency, use_container_width=True)
+        st.vega_lite_chart(df_logs, latency_chart_spec(), use_container_width=True)
     
     # Chart 3: Live Map
-    df_fleet['visual_jitter'] = np.random.uniform(0, 10, len(df_fleet))
-    chart_map = alt.Chart(df_fleet).mark_circle(size=100).encode(
-        x=alt.X('position_m:Q', title='Car Position on Road (meters)'),
-        y=alt.Y('visual_jitter:Q', title='', axis=None),
-        color=alt.Color('battery_percentage:Q', scale=alt.Scale(scheme='redyellowgreen'), title='Battery %'),
-        tooltip=[alt.Tooltip('id', title='Car ID'), alt.Tooltip('battery_percentage', format='.1%', title='Battery Level')]
-    ).properties(height=180, width=800, title="🚗 Live Vehicle Map (Color = Battery Level)")
-    st.altair_chart(chart_map, use_container_width=True)
+    st.vega_lite_chart(df_fleet, map_chart_spec(), use_container_width=True)
     
     # EXPORT SECTION
     st.markdown("---")
@@ -338,11 +518,11 @@ if run_button:
     
     c1, c2, c3 = st.columns(3)
     with c1:
-        st.download_button("Download Energy Data (CSV)", data=df_energy_timeline.to_csv(index=False), file_name="v2v_energy.csv", mime="text/csv")
+        st.download_button("Download Energy Data (CSV)", data=partial(dataframe_to_csv, df_energy_timeline), file_name="v2v_energy.csv", mime="text/csv")
     with c2:
-        st.download_button("Download Full Logs (CSV)", data=df_logs.to_csv(index=False), file_name="v2v_logs.csv", mime="text/csv")
+        st.download_button("Download Full Logs (CSV)", data=partial(dataframe_to_csv, df_logs), file_name="v2v_logs.csv", mime="text/csv")
     with c3:
-        st.download_button("Download Vehicle Fleet (CSV)", data=df_fleet.to_csv(index=False), file_name="v2v_fleet.csv", mime="text/csv")
+        st.download_button("Download Vehicle Fleet (CSV)", data=partial(dataframe_to_csv, df_fleet), file_name="v2v_fleet.csv", mime="text/csv")
 
     # DETAILED DATA TABLE
     with st.expander("🔎 View Detailed Simulation Records (Advanced)"):
@@ -352,7 +532,35 @@ if run_button:
         if not df_ledger.empty:
             st.write("### Ledger (Successful Payments Only)")
             st.dataframe(df_ledger)
-            st.download_button("Download Ledger (CSV)", data=df_ledger.to_csv(index=False), file_name="v2v_ledger.csv", mime="text/csv")
+            st.download_button("Download Ledger (CSV)", data=partial(dataframe_to_csv, df_ledger), file_name="v2v_ledger.csv", mime="text/csv")
+
+# ==========================================
+# 8. MONTE CARLO: MANY SEEDS AT ONCE
+# ==========================================
+monte_carlo_settings = simulation_settings + (number_of_seeds,)
+if monte_carlo_button and st.session_state.get('last_monte_carlo_settings') != monte_carlo_settings:
+    with st.spinner(f"Simulating {number_of_seeds} Highways in Parallel..."):
+        seeds = simulation_seed + np.arange(number_of_seeds)
+        st.session_state['monte_carlo_results'] = run_many_seeds(seeds, number_of_cars, simulation_duration, high_speed_network)
+    st.session_state['last_monte_carlo_settings'] = monte_carlo_settings
+
+if st.session_state.get('last_monte_carlo_settings') == monte_carlo_settings:
+    energy_so_far = st.session_state['monte_carlo_results'].cumsum(axis=1)
+    df_monte_carlo = pd.DataFrame({
+        'round': np.arange(simulation_duration),
+        'mean_kwh': energy_so_far.mean(axis=0),
+        'low_kwh': np.percentile(energy_so_far, 5, axis=0),
+        'high_kwh': np.percentile(energy_so_far, 95, axis=0),
+    })
+    
+    st.markdown("---")
+    st.header("🎲 Monte Carlo Analysis")
+    col1, col2 = st.columns(2)
+    col1.metric("Avg Total Energy Shared", f"{df_monte_carlo['mean_kwh'].iloc[-1]:.2f} kWh", f"over {number_of_seeds} seeds", delta_color="off")
+    col2.metric("90% Range", f"{df_monte_carlo['low_kwh'].iloc[-1]:.2f} – {df_monte_carlo['high_kwh'].iloc[-1]:.2f} kWh", "5th to 95th percentile", delta_color="off")
+    st.vega_lite_chart(df_monte_carlo, monte_carlo_chart_spec(), use_container_width=True)
+    st.download_button("Download Monte Carlo Bands (CSV)", data=partial(dataframe_to_csv, df_monte_carlo), file_name="v2v_monte_carlo.csv", mime="text/csv")
 
-else:
+if (st.session_state.get('last_settings') != simulation_settings
+        and st.session_state.get('last_monte_carlo_settings') != monte_carlo_settings):
     st.info("👈 **Start Here**: Adjust the settings in the sidebar and click 'Run Simulation' to see the results!")